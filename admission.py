@@ -0,0 +1,175 @@
+# admission.py
+"""同時アクセス時の質問の合流（single-flight）と受付制御
+
+Streamlit は 1 プロセス内で複数セッションをスレッドで処理するため、
+ここで持つ状態（実行中の質問・同時実行数）はプロセス全体で共有される。
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import streamlit as st
+
+import constants as ct
+
+
+class OverloadedError(RuntimeError):
+    """実行待ちの列が満杯、または待ち時間が上限を超えたときに送出する。"""
+
+
+class RateLimitedError(RuntimeError):
+    """1セッションからの質問が短時間に多すぎるときに送出する。"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"rate limited (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+# -----------------------------
+# 質問文の正規化
+# -----------------------------
+_SPACES_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[?？!！。．.、,，\s]+$")
+
+
+def normalize_question(question: str) -> str:
+    """表記ゆれ（全角/半角・空白・末尾の「？」など）を吸収したキーを返す。"""
+    text = unicodedata.normalize("NFKC", question or "")
+    text = _SPACES_RE.sub(" ", text).strip().lower()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+# -----------------------------
+# 同一質問の合流（single-flight）
+# -----------------------------
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """同じキーの呼び出しが実行中なら、その結果を待って共有する。
+
+    相乗りした側は wait_timeout_sec までしか待たず、超えたら OverloadedError。
+    """
+
+    def __init__(self, wait_timeout_sec: float):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._wait_timeout_sec = wait_timeout_sec
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            if not flight.done.wait(timeout=self._wait_timeout_sec):
+                raise OverloadedError("timed out waiting for a coalesced call")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # 完了したら即座に外す（結果のキャッシュはしない）
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+
+# -----------------------------
+# 同時実行数と待ち行列の制御
+# -----------------------------
+class AdmissionController:
+    """同時実行数を max_concurrency に抑え、待ちが max_queue を超えたら断る。"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout_sec: float):
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._max_queue = max_queue
+        self._timeout_sec = timeout_sec
+
+    def run(self, fn: Callable[[], Any]) -> Any:
+        # 空きがあれば待ち行列を通さずにそのまま実行する
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self._max_queue:
+                    raise OverloadedError("admission queue is full")
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self._timeout_sec)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                raise OverloadedError("timed out waiting for a free slot")
+
+        try:
+            return fn()
+        finally:
+            self._slots.release()
+
+
+# 相乗りした側の待ち時間 = 先行呼び出しの実行待ち＋実行時間の上限
+_single_flight = SingleFlight(
+    wait_timeout_sec=ct.QA_QUEUE_TIMEOUT_SEC + ct.QA_EXEC_TIMEOUT_SEC,
+)
+_admission = AdmissionController(
+    max_concurrency=ct.QA_MAX_CONCURRENCY,
+    max_queue=ct.QA_MAX_QUEUE,
+    timeout_sec=ct.QA_QUEUE_TIMEOUT_SEC,
+)
+
+
+# -----------------------------
+# セッション単位のレート制限
+# -----------------------------
+def _session_request_times(now: float) -> deque:
+    history = st.session_state.setdefault("qa_request_times", deque())
+    while history and now - history[0] >= ct.SESSION_RATE_LIMIT_WINDOW_SEC:
+        history.popleft()
+    return history
+
+
+def check_session_rate_limit():
+    """直近 SESSION_RATE_LIMIT_WINDOW_SEC 秒の質問数が上限を超えていれば RateLimitedError。
+
+    ここでは数えない。受け付けられた質問だけを record_session_request で記録する。
+    """
+    now = time.monotonic()
+    history = _session_request_times(now)
+    if len(history) >= ct.SESSION_RATE_LIMIT_COUNT:
+        window = ct.SESSION_RATE_LIMIT_WINDOW_SEC
+        retry_after = int(window - (now - history[0])) + 1
+        raise RateLimitedError(retry_after)
+
+
+def record_session_request():
+    """受け付けられた（混雑で断られなかった）質問を 1 件として記録する。"""
+    now = time.monotonic()
+    _session_request_times(now).append(now)
+
+
+def run_coalesced(question: str, fn: Callable[[], Any], scope: str = "") -> Any:
+    """同一質問は 1 回の上流呼び出しにまとめ、その 1 回だけを受付制御に通す。
+
+    scope にはコーパス名などを渡し、別コーパスへの同じ質問は合流させない。
+    """
+    key = f"{scope}\0{normalize_question(question)}"
+    return _single_flight.do(key, lambda: _admission.run(fn))
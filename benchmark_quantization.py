@@ -0,0 +1,176 @@
+# benchmark_quantization.py
+"""量子化インデックスのメモリ削減量と recall@k を計測するスクリプト
+
+既存の Chroma インデックス（年末調整の PDF から作ったもの）に保存済みの
+float32 ベクトルを検索対象とし、float32 の全件検索（正解）と
+量子化インデックスでの検索結果を比較する。
+
+クエリは次の 2 種類から選べる。
+  questions … 実際の質問文（既定は BENCHMARK_QUESTIONS、--questions-file で差し替え）を
+              OpenAI で埋め込んで使う。本番の検索に近い recall@k が得られる
+  chunks    … 各チャンクのベクトルをクエリにする（自分自身は正解・結果の両方から除く）。
+              OpenAI API を呼ばずに計測できる
+
+使い方:
+    python benchmark_quantization.py
+    python benchmark_quantization.py --query-source chunks --queries 200
+    python benchmark_quantization.py --questions-file my_questions.txt --output bench.txt
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import constants as ct
+from quantized_store import coarse_scores, normalize, quantize, top_indices
+
+
+# (モード, 切り詰め次元) の組み合わせ
+CONFIGS = [
+    ("int8", None),
+    ("int8", 512),
+    ("binary", None),
+    ("binary", 512),
+    ("binary", 256),
+]
+
+# 実際に寄せられる質問に近いもの（サイドバーの「よくある質問」を含む）
+BENCHMARK_QUESTIONS = [
+    "扶養控除の対象になるのは誰ですか？",
+    "年末調整が不要になるケースを知りたい。",
+    "住宅ローン控除の書類について教えてください。",
+    "年の途中で退職した人は年末調整の対象になりますか？",
+    "給与の収入金額が2,000万円を超える人は年末調整できますか？",
+    "令和7年分の基礎控除の改正内容を教えてください。",
+    "特定親族特別控除とはどのような控除ですか？",
+    "大学生の子どもがアルバイトで収入がある場合、扶養控除の対象になりますか？",
+    "配偶者控除と配偶者特別控除の違いは何ですか？",
+    "生命保険料控除証明書をなくした場合はどうすればよいですか？",
+    "地震保険料控除の対象となる保険契約を教えてください。",
+    "中途入社の社員の前職の源泉徴収票はどう扱いますか？",
+    "年末調整の後に扶養親族が増えた場合はどうなりますか？",
+    "非居住者は年末調整の対象になりますか？",
+    "2か所から給与をもらっている人の年末調整はどうなりますか？",
+]
+
+
+def load_chroma_vectors(chroma_dir):
+    from langchain_community.vectorstores import Chroma
+
+    chroma = Chroma(persist_directory=chroma_dir)
+    data = chroma._collection.get(include=["embeddings"])
+    return normalize(np.asarray(data["embeddings"], dtype=np.float32))
+
+
+def embed_questions(questions):
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(model=ct.EMBEDDING_MODEL)
+    return normalize(np.asarray([embeddings.embed_query(q) for q in questions], dtype=np.float32))
+
+
+def _search(rescore_vectors, codes, scales, query, mode, truncate_dim, k, multiplier, exclude):
+    scores = coarse_scores(codes, scales, query, mode, truncate_dim)
+    if exclude is not None:
+        scores[exclude] = -np.inf
+    candidates = top_indices(scores, k * multiplier)
+    if multiplier == 1:
+        return candidates[:k]
+    sims = rescore_vectors[candidates].astype(np.float32) @ query
+    return candidates[np.argsort(-sims)[:k]]
+
+
+def run_benchmark(full, queries, k, multipliers, rescore_dtype, exclude_ids=None):
+    """recall@k の表を文字列のリストで返す。
+
+    exclude_ids を渡すと、クエリごとにその行を正解・結果の両方から除く（chunks モード用）。
+    """
+    # float32 の全件検索を正解とする
+    truth = []
+    for qi, query in enumerate(queries):
+        sims = full @ query
+        if exclude_ids is not None:
+            sims[exclude_ids[qi]] = -np.inf
+        truth.append(set(top_indices(sims, k).tolist()))
+
+    rescore_vectors = full.astype(rescore_dtype)
+    float_mb = full.nbytes / (1024 * 1024)
+    lines = [
+        f"チャンク数: {len(full)} / 次元: {full.shape[1]} / クエリ数: {len(queries)} / k={k}",
+        f"float32（全件）: {float_mb:.2f}MB / 並べ替え用ベクトル: {rescore_dtype}"
+        f"（ディスク {rescore_vectors.nbytes / (1024 * 1024):.2f}MB）",
+        "",
+        "mode    dim   RAM(MB)  削減率  rescore  recall@k  検索(ms)",
+    ]
+
+    for mode, truncate_dim in CONFIGS:
+        codes, scales = quantize(full, mode, truncate_dim)
+        mem_mb = (codes.nbytes + scales.nbytes) / (1024 * 1024)
+        dim = truncate_dim or full.shape[1]
+
+        for multiplier in multipliers:
+            hits = 0
+            start = time.perf_counter()
+            for qi, query in enumerate(queries):
+                exclude = None if exclude_ids is None else exclude_ids[qi]
+                found = _search(
+                    rescore_vectors, codes, scales, query, mode, truncate_dim, k, multiplier, exclude
+                )
+                hits += len(truth[qi] & set(found.tolist()))
+            elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            recall = hits / (k * len(queries))
+            label = "なし" if multiplier == 1 else f"x{multiplier}"
+            lines.append(
+                f"{mode:<7} {dim:>4}  {mem_mb:>7.2f}  {float_mb / mem_mb:>5.1f}倍  "
+                f"{label:>6}  {recall:>8.3f}  {elapsed_ms:>7.2f}"
+            )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量子化インデックスのメモリと recall@k を計測する")
+    parser.add_argument("--corpus", default=ct.PURPOSE_NENCHO, choices=list(ct.CORPORA))
+    parser.add_argument("--k", type=int, default=ct.TOP_K)
+    parser.add_argument("--query-source", default="questions", choices=["questions", "chunks"])
+    parser.add_argument("--questions-file", help="1 行 1 質問のテキストファイル（questions モード）")
+    parser.add_argument("--queries", type=int, default=200, help="chunks モードのクエリ数")
+    parser.add_argument(
+        "--multipliers", type=int, nargs="+", default=[1, ct.RESCORE_MULTIPLIER, 10],
+        help="1 次検索で取る候補数の倍数（1 は rescoring なし）",
+    )
+    parser.add_argument("--rescore-dtype", default=ct.RESCORE_DTYPE, choices=["float16", "float32"])
+    parser.add_argument("--output", help="結果を書き出すファイル（data/README.txt への転記用）")
+    args = parser.parse_args()
+
+    chroma_dir = ct.CORPORA[args.corpus]["chroma_dir"]
+    full = load_chroma_vectors(chroma_dir)
+    if len(full) <= args.k:
+        raise SystemExit(
+            f"{chroma_dir} のチャンク数が少なすぎます。先にアプリを起動してインデックスを作成してください。"
+        )
+
+    if args.query_source == "questions":
+        questions = BENCHMARK_QUESTIONS
+        if args.questions_file:
+            with open(args.questions_file, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        queries = embed_questions(questions)
+        exclude_ids = None
+    else:
+        rng = np.random.default_rng(0)
+        exclude_ids = rng.choice(len(full), size=min(args.queries, len(full)), replace=False)
+        queries = full[exclude_ids]
+
+    lines = [f"コーパス: {args.corpus} / クエリ: {args.query_source}"]
+    lines += run_benchmark(full, queries, args.k, args.multipliers, args.rescore_dtype, exclude_ids)
+    print("\n".join(lines))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# calculators.py
+"""所得税の各種控除額の簡易計算ロジック（サイドバーの試算ツールとチャットで共用）"""
+
+
+# -----------------------------
+# 生命保険料控除（新契約）の簡易計算ロジック
+# -----------------------------
+def calc_new_contract_deduction(premium: float) -> int:
+    """新契約（平成24年1月1日以後）の生命保険料控除額を計算する（1区分分）。
+
+    国税庁の「新生命保険料控除」の計算式に基づき、次の階段構造で算出する：
+      〜20,000円      … 支払保険料の全額
+      20,001〜40,000 … 支払保険料×1/2＋10,000
+      40,001〜80,000 … 支払保険料×1/4＋20,000
+      80,001円〜     … 一律40,000円（上限）
+    """
+    if premium <= 0:
+        return 0
+    if premium <= 20_000:
+        return int(premium)
+    elif premium <= 40_000:
+        return int(premium * 0.5 + 10_000)
+    elif premium <= 80_000:
+        return int(premium * 0.25 + 20_000)
+    else:
+        return 40_000  # 区分ごとの上限
+
+
+# -----------------------------
+# 生命保険料控除（旧契約）の簡易計算ロジック
+# -----------------------------
+def calc_old_contract_deduction(premium: float) -> int:
+    """旧契約（平成23年12月31日以前）の生命保険料控除額を計算する（一般・個人年金 共通・所得税）。
+
+    年間の支払保険料等に応じて、旧制度の計算式で控除額を求める：
+      〜25,000円            … 支払保険料等の全額
+      25,001〜50,000円      … 支払保険料等×1/2＋12,500
+      50,001〜100,000円     … 支払保険料等×1/4＋25,000
+      100,001円〜           … 一律50,000円（上限）
+    """
+    if premium <= 0:
+        return 0
+    if premium <= 25_000:
+        return int(premium)
+    elif premium <= 50_000:
+        return int(premium * 0.5 + 12_500)
+    elif premium <= 100_000:
+        return int(premium * 0.25 + 25_000)
+    else:
+        return 50_000  # 旧制度1区分の上限
+
+
+# -----------------------------
+# 地震保険料控除（所得税）の簡易計算ロジック
+# -----------------------------
+def calc_earthquake_insurance_deduction(premium: float) -> int:
+    """地震保険料控除（所得税）のうち、地震保険料部分の控除額を計算する。
+
+    ・支払保険料が 50,000円 以下  … 支払保険料の全額
+    ・支払保険料が 50,000円 超    … 一律 50,000円
+    """
+    if premium <= 0:
+        return 0
+    return int(min(premium, 50_000))
+
+
+def calc_old_long_term_deduction(premium: float) -> int:
+    """地震保険料控除（所得税）のうち、旧長期損害保険料部分の控除額を計算する。
+
+    ・〜10,000円                … 支払保険料の全額
+    ・10,001〜20,000円          … 支払保険料×1/2＋5,000
+    ・20,001円〜                … 一律 15,000円
+    """
+    if premium <= 0:
+        return 0
+    if premium <= 10_000:
+        return int(premium)
+    elif premium <= 20_000:
+        return int(premium * 0.5 + 5_000)
+    else:
+        return 15_000
@@ -10,14 +10,19 @@ APP_TITLE = "年末調整R7 Q&Aアシスタント"
 DATA_DIR = "data"
 
 # --- PDFファイル一覧（必ず data/ 配下に置く） ---
-# ※ initialize.py の pdf_paths と完全一致させています
+# ※ 下の CORPORA の pdf_paths から参照しています
 NENTSU_GUIDE_PDF = f"{DATA_DIR}/nentsu_R7_guide.pdf"        # 年末調整の手引き（メイン）
 NENTSU_KAISEI_PDF = f"{DATA_DIR}/nentsu_R7_kaisei.pdf"      # 税制改正の資料
 NENTSU_QA_PDF     = f"{DATA_DIR}/nencho2025_qa.pdf"         # 年末調整Q&A（令和7年分）
 TAISYOSYA_PDF     = f"{DATA_DIR}/taisyosya.pdf"             # 年末調整の対象者（タックスアンサー2665）
 
+# 確定申告用（令和7年分）
+KAKUTEI_GUIDE_PDF  = f"{DATA_DIR}/kakutei_R7_guide.pdf"     # 確定申告の手引き
+KAKUTEI_KAISEI_PDF = f"{DATA_DIR}/kakutei_R7_kaisei.pdf"    # 確定申告の主な改正事項
+
 # ベクトルストア（Chroma）の保存先ディレクトリ
 CHROMA_DIR = "chroma_nentsu_r7"
+KAKUTEI_CHROMA_DIR = "chroma_kakutei_r7"
 
 # LLM / Embedding モデル設定
 CHAT_MODEL = "gpt-4o-mini"
@@ -26,6 +31,27 @@ EMBEDDING_MODEL = "text-embedding-3-small"
 # tools.py から参照するエイリアス
 LLM_MODEL = CHAT_MODEL
 
+# text-embedding-3-small の次元数（メモリ使用量の概算に使用）
+EMBEDDING_DIM = 1536
+
+# ベクトルの保存形式（括弧内は RAM 上のベクトルの大きさ。float32 比）
+#   "chroma" … Chroma に float32 のまま保存（従来どおり）
+#   "int8"   … int8 に量子化して 1 次検索し、全次元ベクトルで候補を並べ替える（約1/4）
+#   "binary" … 1bit に量子化して 1 次検索し、全次元ベクトルで候補を並べ替える（約1/32）
+# ディスクについて：量子化モードでも並べ替え用の全次元ベクトル（RESCORE_DTYPE）は
+# ディスクに残るため、ディスクの削減は RAM ほど大きくない（float16 なら 1 件あたり
+# 約 3KB＋圧縮ベクトル。Chroma は float32 を約 6KB＋HNSW インデックス）。
+# また既存の Chroma インデックスから変換した場合、元の Chroma ディレクトリは
+# 自動では削除しない（不要になったら手動で削除してください）。
+# 詳しくは quantized_store.py / benchmark_quantization.py を参照
+VECTOR_STORE_MODE = "chroma"
+# 量子化時に先頭何次元まで使うか（Matryoshka 型の切り詰め。None なら全次元）
+EMBEDDING_TRUNCATE_DIM = None
+# 1 次検索で TOP_K × この倍数の候補を取り、全次元ベクトルで並べ替える
+RESCORE_MULTIPLIER = 4
+# 並べ替え用の全次元ベクトルをディスクに保存する型（"float16" または "float32"）
+RESCORE_DTYPE = "float16"
+
 # テキスト分割設定（Q&A・タックスアンサーが丸ごと1チャンクに入りやすいよう少し大きめ）
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 120
@@ -33,6 +59,32 @@ CHUNK_OVERLAP = 120
 # 検索設定（少しだけ k を増やして Q&A / 対象者PDF を拾いやすく）
 TOP_K = 6
 
+# 同時アクセス制御（年末の繁忙期に OpenAI のレート制限を奪い合わないように）
+QA_MAX_CONCURRENCY = 4            # プロセス全体で同時に実行する RAG 呼び出し数
+QA_MAX_QUEUE = 16                 # 実行待ちで並べておける最大数（超えたら即座に断る）
+QA_QUEUE_TIMEOUT_SEC = 30         # 実行待ちの最大秒数
+QA_EMBED_TIMEOUT_SEC = 15         # 質問文の埋め込み（検索）1 回の最大秒数
+QA_LLM_TIMEOUT_SEC = 45           # 回答生成（ChatOpenAI）1 回の最大秒数
+# 1 回の RAG 呼び出しの最大秒数（埋め込み → 回答生成の順に呼ぶため合計）。
+# 上限を守るため、どちらも OpenAI クライアントの自動リトライは行わない
+QA_EXEC_TIMEOUT_SEC = QA_EMBED_TIMEOUT_SEC + QA_LLM_TIMEOUT_SEC
+SESSION_RATE_LIMIT_COUNT = 5      # 1セッションあたり、下記の秒数内に送れる質問数
+SESSION_RATE_LIMIT_WINDOW_SEC = 60
+
+# 混雑時・制限時にユーザーへ表示するメッセージ
+MSG_OVERLOADED = (
+    "ただいま質問が集中しているため、回答を作成できませんでした。\n"
+    "少し時間をおいてから、もう一度お試しください。"
+)
+MSG_RATE_LIMITED = (
+    "短時間に多くの質問が送信されました。\n"
+    "{wait}秒ほど待ってから、もう一度お試しください。"
+)
+MSG_QA_FAILED = (
+    "回答の作成中にエラーが発生しました。\n"
+    "時間をおいてから、もう一度お試しください。"
+)
+
 # RAG 用の System プロンプト
 SYSTEM_PROMPT_QA = """あなたは日本の税務に詳しいアシスタントです。
 ただし、回答の根拠は必ず次の資料に基づいてください。
@@ -63,8 +115,73 @@ SYSTEM_PROMPT_QA = """あなたは日本の税務に詳しいアシスタント
 - 回答の最後に、参照した資料名とページ（分かる範囲で）を日本語でまとめてください。
   例：「参考：年末調整の手引き P.25〜27、タックスアンサー No.2665」"""
 
+# 確定申告モード用の System プロンプト
+SYSTEM_PROMPT_KAKUTEI = """あなたは日本の税務に詳しいアシスタントです。
+ただし、回答の根拠は必ず次の資料に基づいてください。
+
+- 『令和7年分 所得税及び復興特別所得税の確定申告の手引き』
+- 『令和7年分 確定申告の主な改正事項』など、確定申告に関する国税庁資料
+
+【厳守ルール】
+- これらの資料に書いていないことは推測せず、
+  「手引き等に記載がないため、このアプリでは回答できません」
+  と答えてください。
+- 法令の一般論ではなく、あくまで
+  「個人が行う確定申告の実務」の範囲で説明してください。
+- context だけでは結論が出ない場合は、
+  「この情報だけでは判断できません」と答え、無理に判断しないでください。
+- 回答の最後に、参照した資料名とページ（分かる範囲で）を日本語でまとめてください。
+  例：「参考：確定申告の手引き P.12〜13」"""
+
 # RAG で使う ChatPromptTemplate
 PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
     ("system", SYSTEM_PROMPT_QA),
     ("human", "質問: {question}\n\n---\n参考資料:\n{context}")
 ])
+
+PROMPT_TEMPLATE_KAKUTEI = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT_KAKUTEI),
+    ("human", "質問: {question}\n\n---\n参考資料:\n{context}")
+])
+
+# -----------------------------
+# 利用目的（コーパス）ごとの設定
+# -----------------------------
+# render_sidebar の「利用目的」の選択肢と同じ名前をキーにする
+PURPOSE_NENCHO = "令和7年度年末調整"
+PURPOSE_KAKUTEI = "令和7年度確定申告"
+
+CORPORA = {
+    PURPOSE_NENCHO: {
+        "pdf_paths": [
+            NENTSU_GUIDE_PDF,    # 年末調整の手引き
+            NENTSU_QA_PDF,       # 年末調整Q&A（令和7年版）
+            NENTSU_KAISEI_PDF,   # 改正のポイント
+            TAISYOSYA_PDF,       # 年末調整の対象者（タックスアンサー2665）
+        ],
+        "chroma_dir": CHROMA_DIR,
+        "prompt": PROMPT_TEMPLATE,
+        "doc_label": "年末調整の手引き",
+        "caption": "令和7年分『給与所得者の年末調整のしかた』および関連資料をもとにしたQ&Aボットです。",
+        "loading_message": "年末調整の手引きや関連資料を読み込み中...（初回のみ少し時間がかかります）",
+        "chat_placeholder": "年末調整について知りたいことを入力してください",
+    },
+    PURPOSE_KAKUTEI: {
+        "pdf_paths": [
+            KAKUTEI_GUIDE_PDF,   # 確定申告の手引き
+            KAKUTEI_KAISEI_PDF,  # 主な改正事項
+        ],
+        "chroma_dir": KAKUTEI_CHROMA_DIR,
+        "prompt": PROMPT_TEMPLATE_KAKUTEI,
+        "doc_label": "確定申告の手引き",
+        "caption": "令和7年分『確定申告の手引き』および関連資料をもとにしたQ&Aボットです。",
+        "loading_message": "確定申告の手引きや関連資料を読み込み中...（初回のみ少し時間がかかります）",
+        "chat_placeholder": "確定申告について知りたいことを入力してください",
+    },
+}
+
+# ロード済みコーパスのメモリ上限（概算・MB）と、未使用のまま保持する最大秒数
+CORPUS_MEMORY_BUDGET_MB = 512
+CORPUS_IDLE_TTL_SEC = 30 * 60
+# 未使用コーパスの解放を確認する間隔（秒）。アクセスがない間もこの間隔で確認する
+CORPUS_SWEEP_INTERVAL_SEC = 60
@@ -0,0 +1,197 @@
+# corpus_manager.py
+"""利用目的（コーパス）ごとのベクトルストアを遅延ロード・LRU 退避で管理する
+
+1 プロセスで「年末調整」「確定申告」など複数のコーパスを扱うための仕組み。
+・初めて使われたときにだけロード（起動時に全部読み込まない）
+・ロード済みコーパスのメモリ使用量（概算）を合計し、上限を超えたら
+  使われていないものから古い順（LRU）に手放す
+・一定時間使われていないコーパスも手放す（アクセスがなくても定期的に確認する）
+
+手放すときは releaser を呼び、参照を外すだけでは解放されないもの
+（Chroma のクライアントなど）も後始末する。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class _Entry:
+    def __init__(self, store: Any, size_bytes: int):
+        self.store = store
+        self.size_bytes = size_bytes
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class CorpusManager:
+    """コーパス名 → ベクトルストア の対応をプロセス全体で共有する。"""
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        sizer: Callable[[Any], int],
+        budget_bytes: int,
+        idle_ttl_sec: float,
+        releaser: Optional[Callable[[Any], None]] = None,
+        sweep_interval_sec: Optional[float] = None,
+    ):
+        self._loader = loader
+        self._sizer = sizer
+        self._releaser = releaser
+        self._budget_bytes = budget_bytes
+        self._idle_ttl_sec = idle_ttl_sec
+
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # 手放した後、releaser の後始末がまだ終わっていないコーパス
+        self._releasing: Dict[str, threading.Event] = {}
+        # 末尾ほど最近使われたもの
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+        # アクセスが途絶えても idle_ttl_sec で手放せるよう、定期的に確認する
+        if sweep_interval_sec:
+            sweeper = threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval_sec,), daemon=True
+            )
+            sweeper.start()
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[Any]:
+        """コーパスを取得し、with ブロックの間は退避されないように確保する。"""
+        entry = self._get_or_load(name)
+        try:
+            yield entry.store
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                dropped = self._evict_locked()
+            self._release(dropped)
+
+    def ensure_loaded(self, name: str):
+        """コーパスをロードだけしておく（初回アクセス時のスピナー表示用）。"""
+        with self.acquire(name):
+            pass
+
+    def sweep(self):
+        """一定時間使われていないコーパス・上限超過分を手放す。"""
+        with self._lock:
+            dropped = self._evict_locked()
+        self._release(dropped)
+
+    def _sweep_loop(self, interval_sec: float):
+        while True:
+            time.sleep(interval_sec)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[WARN] コーパスの定期解放に失敗しました: {e!r}")
+
+    def _get_or_load(self, name: str) -> _Entry:
+        with self._lock:
+            entry = self._pin_locked(name)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # 同じコーパスを複数セッションが同時にロードしないよう、名前ごとに直列化
+        with load_lock:
+            with self._lock:
+                entry = self._pin_locked(name)
+                if entry is not None:
+                    return entry
+                releasing = self._releasing.get(name)
+
+            # 手放したばかりで後始末中なら、終わるまで待ってからロードし直す
+            # （chromadb は同じ保存先のクライアントを使い回すため、後始末と重なると
+            #   新しくロードしたストアまで停止されてしまう）
+            if releasing is not None:
+                releasing.wait()
+
+            store = self._loader(name)
+            size_bytes = self._sizer(store)
+
+            with self._lock:
+                entry = _Entry(store, size_bytes)
+                entry.in_use = 1
+                self._entries[name] = entry
+                print(
+                    f"[INFO] コーパスをロードしました: {name}"
+                    f"（約 {size_bytes / (1024 * 1024):.1f}MB）"
+                )
+                dropped = self._evict_locked()
+
+        # 他コーパスの後始末は、このコーパスのロード用ロックを外してから行う
+        self._release(dropped)
+        return entry
+
+    def _pin_locked(self, name: str):
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(name)
+        return entry
+
+    def _evict_locked(self) -> List[Tuple[str, Any]]:
+        """手放したコーパスの (名前, ストア) を返す（releaser はロックの外で呼ぶ）。"""
+        now = time.monotonic()
+        dropped = []
+
+        # 1) 一定時間使われていないものを手放す
+        for name, e in list(self._entries.items()):
+            if e.in_use == 0 and now - e.last_used >= self._idle_ttl_sec:
+                dropped.append(self._drop_locked(name, "idle"))
+
+        # 2) 上限を超えていれば、使用中でないものを古い順に手放す
+        total = sum(e.size_bytes for e in self._entries.values())
+        for name, e in list(self._entries.items()):
+            if total <= self._budget_bytes:
+                break
+            if e.in_use == 0:
+                total -= e.size_bytes
+                dropped.append(self._drop_locked(name, "lru"))
+
+        if total > self._budget_bytes:
+            print(
+                f"[WARN] コーパスのメモリ上限を超えています"
+                f"（約 {total / (1024 * 1024):.1f}MB、すべて使用中のため退避できません）"
+            )
+        if dropped:
+            print(f"[INFO] ロード中のコーパス: {self._stats_locked()}")
+        return dropped
+
+    def _drop_locked(self, name: str, reason: str) -> Tuple[str, Any]:
+        entry = self._entries.pop(name)
+        # エントリを外すのと同時に「後始末中」にする。再ロードは _release の完了を待つ
+        self._releasing[name] = threading.Event()
+        print(f"[INFO] コーパスを解放しました: {name}（{reason}）")
+        return name, entry.store
+
+    def _release(self, dropped: List[Tuple[str, Any]]):
+        for name, store in dropped:
+            try:
+                if self._releaser is not None:
+                    self._releaser(store)
+            except Exception as e:
+                print(f"[WARN] コーパスの後始末に失敗しました: {e!r}")
+            finally:
+                with self._lock:
+                    done = self._releasing.pop(name)
+                done.set()
+
+    def _stats_locked(self) -> Dict[str, Dict[str, Any]]:
+        """ロード済みコーパスの概算メモリと利用状況（ログ用）。"""
+        now = time.monotonic()
+        return {
+            name: {
+                "size_mb": round(e.size_bytes / (1024 * 1024), 1),
+                "in_use": e.in_use,
+                "idle_sec": int(now - e.last_used),
+            }
+            for name, e in self._entries.items()
+        }
@@ -2,7 +2,6 @@
 """RAG 用ベクトルストアの初期化処理"""
 
 import os
-import streamlit as st
 
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -10,17 +9,12 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 
 import constants as ct
+from corpus_manager import CorpusManager
+from quantized_store import QuantizedVectorStore
 
 
-def _load_guide_documents():
-    """data フォルダ内の PDF（4種）を読み込む"""
-
-    pdf_paths = [
-        ct.NENTSU_GUIDE_PDF,    # 年末調整の手引き
-        ct.NENTSU_QA_PDF,       # 年末調整Q&A（令和7年版）
-        ct.NENTSU_KAISEI_PDF,   # 改正のポイント
-        ct.TAISYOSYA_PDF,       # 年末調整の対象者（タックスアンサー2665）
-    ]
+def _load_guide_documents(pdf_paths):
+    """data フォルダ内の PDF（コーパスごとに指定されたもの）を読み込む"""
 
     documents = []
     for path in pdf_paths:
@@ -54,8 +48,21 @@ def _split_documents(documents):
     return splitter.split_documents(documents)
 
 
-def _build_vectorstore():
-    docs = _load_guide_documents()
+def _chroma_exists(chroma_dir):
+    return os.path.exists(chroma_dir) and os.listdir(chroma_dir)
+
+
+def _quantized_dir(corpus_name):
+    """量子化インデックスの保存先（モード・次元ごとに分ける）"""
+    path = f"{ct.CORPORA[corpus_name]['chroma_dir']}_{ct.VECTOR_STORE_MODE}"
+    if ct.EMBEDDING_TRUNCATE_DIM:
+        path += f"_{ct.EMBEDDING_TRUNCATE_DIM}"
+    return path
+
+
+def _build_vectorstore(corpus_name):
+    corpus = ct.CORPORA[corpus_name]
+    docs = _load_guide_documents(corpus["pdf_paths"])
     if not docs:
         raise RuntimeError(
             "参照用PDFが1つも読み込めませんでした。data フォルダを確認してください。"
@@ -64,31 +71,150 @@ def _build_vectorstore():
     chunks = _split_documents(docs)
     embeddings = OpenAIEmbeddings(model=ct.EMBEDDING_MODEL)
 
+    if ct.VECTOR_STORE_MODE != "chroma":
+        return QuantizedVectorStore.from_documents(
+            documents=chunks,
+            embedding=embeddings,
+            persist_directory=_quantized_dir(corpus_name),
+            mode=ct.VECTOR_STORE_MODE,
+            truncate_dim=ct.EMBEDDING_TRUNCATE_DIM,
+            rescore_multiplier=ct.RESCORE_MULTIPLIER,
+            rescore_dtype=ct.RESCORE_DTYPE,
+        )
+
     vs = Chroma.from_documents(
         documents=chunks,
         embedding=embeddings,
-        persist_directory=ct.CHROMA_DIR,
+        persist_directory=corpus["chroma_dir"],
+    )
+    return vs
+
+
+def _convert_chroma_to_quantized(chroma_dir, embeddings, corpus_name):
+    """既存の Chroma インデックスから量子化インデックスを作る（再埋め込み不要）"""
+    chroma = Chroma(embedding_function=embeddings, persist_directory=chroma_dir)
+    try:
+        data = chroma._collection.get(include=["embeddings", "documents", "metadatas"])
+    finally:
+        # 変換に使った Chroma はここで手放す（chromadb のキャッシュに残さない）
+        release_vectorstore(chroma)
+
+    vs = QuantizedVectorStore(
+        embedding=embeddings,
+        persist_directory=_quantized_dir(corpus_name),
+        mode=ct.VECTOR_STORE_MODE,
+        truncate_dim=ct.EMBEDDING_TRUNCATE_DIM,
+        rescore_multiplier=ct.RESCORE_MULTIPLIER,
+        rescore_dtype=ct.RESCORE_DTYPE,
     )
+    vs.add_vectors(data["embeddings"], data["documents"], data["metadatas"])
     return vs
 
 
-def get_vectorstore():
-    if os.path.exists(ct.CHROMA_DIR) and os.listdir(ct.CHROMA_DIR):
-        embeddings = OpenAIEmbeddings(model=ct.EMBEDDING_MODEL)
-        vs = Chroma(
-            embedding_function=embeddings,
-            persist_directory=ct.CHROMA_DIR,
+def _query_embeddings():
+    """検索時（質問文）の埋め込み。RAG 1 回の時間上限に収まるよう、タイムアウトを付けてリトライしない。
+
+    PDF のインデックス作成（大量の埋め込み）には使わない。
+    """
+    return OpenAIEmbeddings(
+        model=ct.EMBEDDING_MODEL,
+        timeout=ct.QA_EMBED_TIMEOUT_SEC,
+        max_retries=0,
+    )
+
+
+def get_vectorstore(corpus_name=ct.PURPOSE_NENCHO):
+    chroma_dir = ct.CORPORA[corpus_name]["chroma_dir"]
+
+    # インデックスがなければ先に作り、検索用の埋め込みを付けて開き直す
+    if ct.VECTOR_STORE_MODE != "chroma":
+        quantized_dir = _quantized_dir(corpus_name)
+        if not QuantizedVectorStore.exists(quantized_dir):
+            if _chroma_exists(chroma_dir):
+                _convert_chroma_to_quantized(
+                    chroma_dir, OpenAIEmbeddings(model=ct.EMBEDDING_MODEL), corpus_name
+                )
+            else:
+                _build_vectorstore(corpus_name)
+        return QuantizedVectorStore.load(
+            embedding=_query_embeddings(),
+            persist_directory=quantized_dir,
+            rescore_multiplier=ct.RESCORE_MULTIPLIER,
         )
-    else:
-        vs = _build_vectorstore()
 
+    if not _chroma_exists(chroma_dir):
+        _build_vectorstore(corpus_name)
+
+    vs = Chroma(
+        embedding_function=_query_embeddings(),
+        persist_directory=chroma_dir,
+    )
     return vs
 
 
-def setup_retriever():
-    if "retriever" in st.session_state:
+def estimate_vectorstore_bytes(vs):
+    """ベクトルストアのメモリ使用量を概算する（ベクトル本体＋チャンク本文）。"""
+    if isinstance(vs, QuantizedVectorStore):
+        return vs.memory_bytes()
+    try:
+        count = vs._collection.count()
+    except Exception:
+        count = 0
+    # float32 のベクトル + 日本語チャンク本文（UTF-8 で 1 文字 3 バイト程度）
+    per_chunk = ct.EMBEDDING_DIM * 4 + ct.CHUNK_SIZE * 3
+    return count * per_chunk
+
+
+def is_corpus_available(corpus_name):
+    """インデックス済み、または参照用PDFが 1 つ以上置かれていれば True。"""
+    corpus = ct.CORPORA[corpus_name]
+    if _chroma_exists(corpus["chroma_dir"]):
+        return True
+    if ct.VECTOR_STORE_MODE != "chroma" and QuantizedVectorStore.exists(_quantized_dir(corpus_name)):
+        return True
+    return any(os.path.exists(p) for p in corpus["pdf_paths"])
+
+
+def release_vectorstore(vs):
+    """コーパスを手放すときの後始末。
+
+    chromadb はクライアントの実体（System）を保存先ごとにクラス変数でキャッシュするため、
+    参照を外すだけではインデックスがメモリに残る。キャッシュから外して停止する。
+    量子化ストアは参照を外せば解放されるので何もしない。
+    """
+    client = getattr(vs, "_client", None)
+    identifier = getattr(client, "_identifier", None)
+    if identifier is None:
         return
 
-    vs = get_vectorstore()
-    retriever = vs.as_retriever(search_kwargs={"k": ct.TOP_K})
-    st.session_state["retriever"] = retriever
+    # SharedSystemClient のクラス変数（chromadb のバージョンにより refcount もある）
+    systems = getattr(type(client), "_identifier_to_system", {})
+    refcounts = getattr(type(client), "_identifier_to_refcount", {})
+    refcounts.pop(identifier, None)
+    system = systems.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
+
+# プロセス全体で 1 つだけ持つ（Streamlit の全セッションで共有）
+_corpus_manager = CorpusManager(
+    loader=get_vectorstore,
+    sizer=estimate_vectorstore_bytes,
+    budget_bytes=ct.CORPUS_MEMORY_BUDGET_MB * 1024 * 1024,
+    idle_ttl_sec=ct.CORPUS_IDLE_TTL_SEC,
+    releaser=release_vectorstore,
+    sweep_interval_sec=ct.CORPUS_SWEEP_INTERVAL_SEC,
+)
+
+
+def get_corpus_manager():
+    return _corpus_manager
+
+
+def setup_retriever(corpus_name=ct.PURPOSE_NENCHO):
+    """選択中のコーパスをロードしておく（初回アクセス時のスピナー表示用）。
+
+    retriever 自体はセッションに保持しない（保持すると退避しても解放されないため）。
+    質問のたびに tools.ask_nentsu_qa がコーパスマネージャから取得する。
+    """
+    _corpus_manager.ensure_loaded(corpus_name)
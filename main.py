@@ -2,87 +2,21 @@
 
 import streamlit as st
 import constants as ct
-from initialize import setup_retriever
-from tools import ask_nentsu_qa
-
-
-# -----------------------------
-# 生命保険料控除（新契約）の簡易計算ロジック
-# -----------------------------
-def calc_new_contract_deduction(premium: float) -> int:
-    """新契約（平成24年1月1日以後）の生命保険料控除額を計算する（1区分分）。
-
-    国税庁の「新生命保険料控除」の計算式に基づき、次の階段構造で算出する：
-      〜20,000円      … 支払保険料の全額
-      20,001〜40,000 … 支払保険料×1/2＋10,000
-      40,001〜80,000 … 支払保険料×1/4＋20,000
-      80,001円〜     … 一律40,000円（上限）
-    """
-    if premium <= 0:
-        return 0
-    if premium <= 20_000:
-        return int(premium)
-    elif premium <= 40_000:
-        return int(premium * 0.5 + 10_000)
-    elif premium <= 80_000:
-        return int(premium * 0.25 + 20_000)
-    else:
-        return 40_000  # 区分ごとの上限
-
-
-# -----------------------------
-# 生命保険料控除（旧契約）の簡易計算ロジック
-# -----------------------------
-def calc_old_contract_deduction(premium: float) -> int:
-    """旧契約（平成23年12月31日以前）の生命保険料控除額を計算する（一般・個人年金 共通・所得税）。
-
-    年間の支払保険料等に応じて、旧制度の計算式で控除額を求める：
-      〜25,000円            … 支払保険料等の全額
-      25,001〜50,000円      … 支払保険料等×1/2＋12,500
-      50,001〜100,000円     … 支払保険料等×1/4＋25,000
-      100,001円〜           … 一律50,000円（上限）
-    """
-    if premium <= 0:
-        return 0
-    if premium <= 25_000:
-        return int(premium)
-    elif premium <= 50_000:
-        return int(premium * 0.5 + 12_500)
-    elif premium <= 100_000:
-        return int(premium * 0.25 + 25_000)
-    else:
-        return 50_000  # 旧制度1区分の上限
-
-
-# -----------------------------
-# 地震保険料控除（所得税）の簡易計算ロジック
-# -----------------------------
-def calc_earthquake_insurance_deduction(premium: float) -> int:
-    """地震保険料控除（所得税）のうち、地震保険料部分の控除額を計算する。
-
-    ・支払保険料が 50,000円 以下  … 支払保険料の全額
-    ・支払保険料が 50,000円 超    … 一律 50,000円
-    """
-    if premium <= 0:
-        return 0
-    return int(min(premium, 50_000))
-
-
-def calc_old_long_term_deduction(premium: float) -> int:
-    """地震保険料控除（所得税）のうち、旧長期損害保険料部分の控除額を計算する。
-
-    ・〜10,000円                … 支払保険料の全額
-    ・10,001〜20,000円          … 支払保険料×1/2＋5,000
-    ・20,001円〜                … 一律 15,000円
-    """
-    if premium <= 0:
-        return 0
-    if premium <= 10_000:
-        return int(premium)
-    elif premium <= 20_000:
-        return int(premium * 0.5 + 5_000)
-    else:
-        return 15_000
+from admission import (
+    OverloadedError,
+    RateLimitedError,
+    check_session_rate_limit,
+    record_session_request,
+    run_coalesced,
+)
+from calculators import (
+    calc_earthquake_insurance_deduction,
+    calc_new_contract_deduction,
+    calc_old_contract_deduction,
+    calc_old_long_term_deduction,
+)
+from initialize import get_corpus_manager, is_corpus_available, setup_retriever
+from tools import answer_deduction_question, ask_nentsu_qa
 
 
 # -----------------------------
@@ -104,7 +38,7 @@ def render_sidebar() -> str:
 
         purpose = st.radio(
             "利用したい機能を選択してください",
-            ("令和7年度年末調整", "令和7年度確定申告"),
+            (ct.PURPOSE_NENCHO, ct.PURPOSE_KAKUTEI),
             index=0,  # デフォルトは「年末調整」
         )
         
@@ -400,14 +334,13 @@ def render_sidebar() -> str:
 # -----------------------------
 # メインエリア描画
 # -----------------------------
-def render_header():
+def render_header(purpose: str):
+    corpus = ct.CORPORA[purpose]
     st.title(ct.APP_TITLE)
-    st.caption(
-        "令和7年分『給与所得者の年末調整のしかた』および関連資料をもとにしたQ&Aボットです。"
-    )
+    st.caption(corpus["caption"])
     with st.expander("このアプリについて", expanded=False):
         st.markdown(
-            """- 回答は **令和7年分 年末調整の手引き** や関連する税制改正資料をもとに行います。
+            f"""- 回答は **令和7年分 {corpus["doc_label"]}** や関連する税制改正資料をもとに行います。
             - 実際の申告・届出にあたっては、必ず原本の手引きや税務署等の案内をご確認ください。
             - 個別具体的な税務判断の最終決定には利用できません。"""
         )
@@ -430,30 +363,30 @@ def main():
     # 左側の「利用目的」＆ 各種簡易計算ツール ＆「よくある質問」
     purpose = render_sidebar()
 
+    corpus = ct.CORPORA[purpose]
+
     # ヘッダー
-    render_header()
+    render_header(purpose)
 
-    # 令和7年度確定申告はまだ未実装 → 工事中メッセージを出して終了
-    if purpose == "令和7年度確定申告":
+    # 参照用PDFがまだ配置されていないコーパス → 工事中メッセージを出して終了
+    if not is_corpus_available(purpose):
         st.info(
-            "「令和7年度確定申告」モードは現在、鋭意開発中です（工事中...）。\n"
-            "今のところは「令和7年度年末調整」を選択してご利用ください。"
+            f"「{purpose}」モードは現在、鋭意開発中です（工事中...）。\n"
+            "参照用PDFが data フォルダに配置されると利用できるようになります。"
         )
         return  # RAG 初期化やチャットは行わない
 
-    # ここから下は「令和7年度年末調整」モード専用の処理
+    # 選択中のコーパスを（初回のみ）ロード。未使用のコーパスはメモリに載せない
     try:
-        with st.spinner(
-            "年末調整の手引きや関連資料を読み込み中...（初回のみ少し時間がかかります）"
-        ):
-            setup_retriever()
+        with st.spinner(corpus["loading_message"]):
+            setup_retriever(purpose)
     except Exception as e:
         st.error(f"初期化中にエラーが発生しました: {e}")
         return
 
     render_chat_history()
 
-    user_input = st.chat_input("年末調整について知りたいことを入力してください")
+    user_input = st.chat_input(corpus["chat_placeholder"])
     if not user_input:
         return
 
@@ -462,14 +395,39 @@ def main():
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    # RAG による回答
+    # 計算ツール or RAG による回答
     with st.chat_message("assistant"):
         with st.spinner("手引きや関連資料を確認しています..."):
             try:
-                result = ask_nentsu_qa(user_input)
+                # 控除額の計算で答えられる質問は、LLM を使わずに計算ツールで回答する
+                result = answer_deduction_question(user_input, purpose)
+                if result is None:
+                    check_session_rate_limit()
+                    # 同じ質問が同時に来た場合は 1 回の RAG 呼び出しを共有する
+                    try:
+                        # コーパスのロード（退避後の再ロード）は受付制御の外で済ませる。
+                        # 回答を作っている間は退避されないよう確保しておく
+                        with get_corpus_manager().acquire(purpose) as vs:
+                            result = run_coalesced(
+                                user_input,
+                                lambda: ask_nentsu_qa(user_input, purpose, vs),
+                                scope=purpose,
+                            )
+                    except OverloadedError:
+                        # 混雑で断られた質問はセッションの質問数に数えない
+                        raise
+                    except Exception:
+                        record_session_request()
+                        raise
+                    record_session_request()
                 answer = result["answer"]
+            except RateLimitedError as e:
+                answer = ct.MSG_RATE_LIMITED.format(wait=e.retry_after)
+            except OverloadedError:
+                answer = ct.MSG_OVERLOADED
             except Exception as e:
-                answer = f"エラーが発生しました: {e}"
+                print(f"[ERROR] ask_nentsu_qa に失敗しました: {e!r}")
+                answer = ct.MSG_QA_FAILED
             st.markdown(answer)
             st.session_state["messages"].append(
                 {"role": "assistant", "content": answer}
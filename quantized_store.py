@@ -0,0 +1,313 @@
+# quantized_store.py
+"""量子化した埋め込みベクトルで検索するベクトルストア（Chroma の代替・任意）
+
+・メモリ上には圧縮したベクトル（int8 またはバイナリ）だけを持ち、1次検索はこれで行う
+・text-embedding-3 系は Matryoshka 型で学習されているため、先頭 truncate_dim 次元に
+  切り詰めても検索精度の低下が小さい（切り詰めた後は正規化し直す）
+・1次検索で k × rescore_multiplier 件の候補を取り、ディスク上（memmap）の
+  全次元ベクトルで並べ替える（rescoring）。全次元ベクトルは RAM に載せない
+・並べ替え用の全次元ベクトルは既定で float16 で保存する（ディスクは float32 の半分。
+  並べ替えの順位への影響はごく小さい）。ディスク上には圧縮ベクトルと合わせて
+  保存されるため、RAM ほどは減らない点に注意
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+QUANTIZATION_MODES = ("int8", "binary")
+RESCORE_DTYPES = ("float16", "float32")
+
+_CODES_FILE = "codes.npy"
+_SCALES_FILE = "scales.npy"
+_FULL_FILE = "full.npy"
+_DOCS_FILE = "docs.json"
+_META_FILE = "meta.json"
+
+# 1 バイト中の立っているビット数（ハミング距離の計算用）
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# 1次検索を一度に計算する行数（int8 → float32 の一時領域を抑えるため）
+_BLOCK_ROWS = 4096
+
+
+# -----------------------------
+# 量子化と 1 次検索（ベンチマークからも使う）
+# -----------------------------
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def truncate(vectors: np.ndarray, truncate_dim: Optional[int]) -> np.ndarray:
+    """Matryoshka 型の次元切り詰め（先頭 truncate_dim 次元を残して正規化し直す）。"""
+    if truncate_dim:
+        vectors = np.asarray(vectors)[..., :truncate_dim]
+    return normalize(vectors)
+
+
+def quantize(
+    vectors: np.ndarray, mode: str, truncate_dim: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(codes, scales) を返す。binary の scales は空配列。"""
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"未対応の量子化モードです: {mode}")
+
+    vectors = truncate(vectors, truncate_dim)
+    if mode == "binary":
+        return np.packbits(vectors > 0, axis=-1), np.empty(0, dtype=np.float32)
+
+    # int8：ベクトルごとに最大絶対値が 127 になるよう対称スケーリング
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def coarse_scores(
+    codes: np.ndarray,
+    scales: np.ndarray,
+    query: np.ndarray,
+    mode: str,
+    truncate_dim: Optional[int] = None,
+) -> np.ndarray:
+    """圧縮ベクトルでの近似スコア（大きいほど類似）を返す。"""
+    q = truncate(query, truncate_dim)
+    if mode == "binary":
+        q_bits = np.packbits(q > 0)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            hamming = _POPCOUNT[np.bitwise_xor(block, q_bits)].sum(axis=1)
+            scores[start:start + _BLOCK_ROWS] = -hamming.astype(np.float32)
+        return scores
+
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        block = codes[start:start + _BLOCK_ROWS].astype(np.float32)
+        scores[start:start + _BLOCK_ROWS] = block @ q
+    return scores * scales
+
+
+def top_indices(scores: np.ndarray, n: int) -> np.ndarray:
+    """スコアの大きい順に上位 n 件のインデックスを返す。"""
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, n - 1)[:n]
+    return idx[np.argsort(-scores[idx])]
+
+
+def rescore(full: np.ndarray, candidates: np.ndarray, query: np.ndarray, k: int):
+    """候補だけを全次元のコサイン類似度で並べ替え、(indices, scores) を返す。"""
+    if len(candidates) == 0:
+        return candidates, np.empty(0, dtype=np.float32)
+    # memmap から読むのは候補の行だけ（昇順で読むとディスクアクセスが素直になる）
+    candidates = np.sort(candidates)
+    sims = np.asarray(full[candidates], dtype=np.float32) @ normalize(query)
+    order = np.argsort(-sims)[:k]
+    return candidates[order], sims[order]
+
+
+# -----------------------------
+# LangChain の VectorStore 実装
+# -----------------------------
+class QuantizedVectorStore(VectorStore):
+    """圧縮ベクトルで 1 次検索し、全次元ベクトルで候補を並べ替えるベクトルストア。"""
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        persist_directory: str,
+        mode: str = "int8",
+        truncate_dim: Optional[int] = None,
+        rescore_multiplier: int = 4,
+        rescore_dtype: str = "float16",
+    ):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"未対応の量子化モードです: {mode}")
+        if rescore_dtype not in RESCORE_DTYPES:
+            raise ValueError(f"未対応の並べ替え用ベクトルの型です: {rescore_dtype}")
+
+        self._embedding = embedding
+        self.persist_directory = persist_directory
+        self.mode = mode
+        self.truncate_dim = truncate_dim
+        self.rescore_multiplier = rescore_multiplier
+        self.rescore_dtype = rescore_dtype
+
+        self._docs: List[Dict[str, Any]] = []
+        self._codes = np.empty((0, 0), dtype=np.int8)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._full: Optional[np.ndarray] = None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # ---- 保存・読み込み ----
+    @classmethod
+    def exists(cls, persist_directory: str) -> bool:
+        return os.path.exists(os.path.join(persist_directory, _META_FILE))
+
+    @classmethod
+    def load(
+        cls,
+        embedding: Embeddings,
+        persist_directory: str,
+        rescore_multiplier: int = 4,
+    ) -> "QuantizedVectorStore":
+        with open(os.path.join(persist_directory, _META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(persist_directory, _DOCS_FILE), encoding="utf-8") as f:
+            docs = json.load(f)
+
+        vs = cls(
+            embedding=embedding,
+            persist_directory=persist_directory,
+            mode=meta["mode"],
+            truncate_dim=meta.get("truncate_dim"),
+            rescore_multiplier=rescore_multiplier,
+            rescore_dtype=meta.get("rescore_dtype", "float32"),
+        )
+        vs._docs = docs
+        vs._codes = np.load(os.path.join(persist_directory, _CODES_FILE))
+        vs._scales = np.load(os.path.join(persist_directory, _SCALES_FILE))
+        # 全次元ベクトルはディスクに置いたまま、必要な行だけ読む
+        vs._full = np.load(os.path.join(persist_directory, _FULL_FILE), mmap_mode="r")
+        return vs
+
+    def _save(self, full: np.ndarray):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        np.save(os.path.join(self.persist_directory, _FULL_FILE), full.astype(self.rescore_dtype))
+        np.save(os.path.join(self.persist_directory, _CODES_FILE), self._codes)
+        np.save(os.path.join(self.persist_directory, _SCALES_FILE), self._scales)
+        with open(os.path.join(self.persist_directory, _DOCS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._docs, f, ensure_ascii=False)
+        # meta.json は最後に書く（exists() の判定に使うため）
+        with open(os.path.join(self.persist_directory, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "mode": self.mode,
+                    "truncate_dim": self.truncate_dim,
+                    "rescore_dtype": self.rescore_dtype,
+                    "count": len(self._docs),
+                    "dim": int(full.shape[1]) if full.size else 0,
+                },
+                f,
+            )
+        self._full = np.load(os.path.join(self.persist_directory, _FULL_FILE), mmap_mode="r")
+
+    # ---- 追加 ----
+    def add_vectors(
+        self,
+        vectors: np.ndarray,
+        texts: List[str],
+        metadatas: Optional[List[dict]] = None,
+    ) -> List[str]:
+        """埋め込み済みのベクトルを追加する（Chroma からの変換などで使う）。"""
+        metadatas = metadatas or [{} for _ in texts]
+        start = len(self._docs)
+        ids = [str(start + i) for i in range(len(texts))]
+
+        new_full = normalize(vectors)
+        if self._full is not None and len(self._full):
+            full = np.concatenate([np.asarray(self._full, dtype=np.float32), new_full])
+        else:
+            full = new_full
+
+        self._docs.extend(
+            {"id": i, "page_content": t, "metadata": m or {}}
+            for i, t, m in zip(ids, texts, metadatas)
+        )
+        self._codes, self._scales = quantize(full, self.mode, self.truncate_dim)
+        self._save(full)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        return self.add_vectors(vectors, texts, metadatas)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: str = "quantized_index",
+        mode: str = "int8",
+        truncate_dim: Optional[int] = None,
+        rescore_multiplier: int = 4,
+        rescore_dtype: str = "float16",
+        **kwargs: Any,
+    ) -> "QuantizedVectorStore":
+        vs = cls(
+            embedding=embedding,
+            persist_directory=persist_directory,
+            mode=mode,
+            truncate_dim=truncate_dim,
+            rescore_multiplier=rescore_multiplier,
+            rescore_dtype=rescore_dtype,
+        )
+        vs.add_texts(texts, metadatas)
+        return vs
+
+    # ---- 検索 ----
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        if not self._docs:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = coarse_scores(
+            self._codes, self._scales, query, self.mode, self.truncate_dim
+        )
+        candidates = top_indices(scores, k * max(self.rescore_multiplier, 1))
+        indices, sims = rescore(self._full, candidates, query, k)
+
+        results = []
+        for i, sim in zip(indices, sims):
+            d = self._docs[int(i)]
+            results.append(
+                (Document(page_content=d["page_content"], metadata=d["metadata"]), float(sim))
+            )
+        return results
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k=k)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        # コサイン類似度（-1〜1）を 0〜1 に変換
+        return lambda score: (score + 1.0) / 2.0
+
+    # ---- メモリ使用量 ----
+    def memory_bytes(self) -> int:
+        """RAM に載る量の概算（圧縮ベクトル＋チャンク本文）。全次元ベクトルはディスク上。"""
+        text_bytes = sum(len(d["page_content"].encode("utf-8")) for d in self._docs)
+        return int(self._codes.nbytes + self._scales.nbytes + text_bytes)
@@ -1,8 +1,15 @@
 # tools.py
-from typing import Dict, Any
-import streamlit as st
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple
 
 import constants as ct
+from calculators import (
+    calc_earthquake_insurance_deduction,
+    calc_new_contract_deduction,
+    calc_old_contract_deduction,
+    calc_old_long_term_deduction,
+)
 from utils import extract_page_numbers_from_sources, build_page_reference_text
 
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough
@@ -10,20 +17,23 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 
 
-def ask_nentsu_qa(question: str) -> Dict[str, Any]:
-    """年末調整の手引きに基づいて RAG で回答し、
+def ask_nentsu_qa(question: str, corpus_name: str, vectorstore) -> Dict[str, Any]:
+    """選択中のコーパス（年末調整の手引き等）に基づいて RAG で回答し、
     回答 + 参考ページ(P.xx) を返す（LangChain 0.2 対応版）
+
+    vectorstore は呼び出し側がコーパスマネージャから確保したもの
+    （ロードを受付制御の外で済ませ、OpenAI 呼び出しだけを時間上限の対象にするため）。
     """
 
-    # initialize.py で作った retriever が前提
-    retriever = st.session_state.get("retriever")
-    if retriever is None:
-        raise RuntimeError("retriever が初期化されていません（initialize.setup_retriever がまだ実行されていません）。")
+    corpus = ct.CORPORA[corpus_name]
+    retriever = vectorstore.as_retriever(search_kwargs={"k": ct.TOP_K})
 
-    # LLM は呼ぶたびに生成（シンプルに）
+    # LLM は呼ぶたびに生成（シンプルに）。時間上限を守るため自動リトライはしない
     llm = ChatOpenAI(
         model=ct.LLM_MODEL,
         temperature=0.1,
+        timeout=ct.QA_LLM_TIMEOUT_SEC,
+        max_retries=0,
     )
 
     # RAG チェーン（context + question を LLM に渡す）
@@ -32,7 +42,7 @@ def ask_nentsu_qa(question: str) -> Dict[str, Any]:
             "context": retriever,
             "question": RunnablePassthrough(),
         }
-        | ct.PROMPT_TEMPLATE
+        | corpus["prompt"]
         | llm
         | StrOutputParser()
     )
@@ -51,7 +61,7 @@ def ask_nentsu_qa(question: str) -> Dict[str, Any]:
     # ドキュメントからページ番号を抽出
     docs = result["docs"]
     pages = extract_page_numbers_from_sources(docs)
-    page_ref = build_page_reference_text(pages)
+    page_ref = build_page_reference_text(pages, corpus["doc_label"])
 
     # 最終的な表示用テキスト
     full_answer = f"{answer_text}\n\n{page_ref}"
@@ -60,3 +70,235 @@ def ask_nentsu_qa(question: str) -> Dict[str, Any]:
         "answer": full_answer,
         "page_ref": page_ref,
     }
+
+
+# -----------------------------
+# 控除額の計算質問は LLM を使わずに計算ツールで回答する
+# -----------------------------
+# intent → 計算関数。LLM のツール呼び出しにはせず、ここで直接振り分ける
+# （LLM を経由しないことで、遅延と API コストをなくすのが目的のため）。
+# formula は回答に添える計算式、citation は参考資料の該当箇所
+_NEW_CONTRACT_FORMULA = "〜2万円：全額／〜4万円：×1/2＋1万円／〜8万円：×1/4＋2万円／8万円超：一律4万円"
+_NEW_CONTRACT_CITATION = "生命保険料控除額の計算（新契約）"
+_OLD_CONTRACT_FORMULA = "〜2.5万円：全額／〜5万円：×1/2＋1.25万円／〜10万円：×1/4＋2.5万円／10万円超：一律5万円"
+_OLD_CONTRACT_CITATION = "生命保険料控除額の計算（旧契約）"
+
+DEDUCTION_TOOLS: Dict[str, Dict[str, Any]] = {
+    "life_general_new": {
+        "label": "新契約の一般生命保険料",
+        "deduction": "一般生命保険料控除",
+        "func": calc_new_contract_deduction,
+        "formula": _NEW_CONTRACT_FORMULA,
+        "citation": _NEW_CONTRACT_CITATION,
+    },
+    "life_general_old": {
+        "label": "旧契約の一般生命保険料",
+        "deduction": "一般生命保険料控除",
+        "func": calc_old_contract_deduction,
+        "formula": _OLD_CONTRACT_FORMULA,
+        "citation": _OLD_CONTRACT_CITATION,
+    },
+    "life_medical": {
+        "label": "介護医療保険料",
+        "deduction": "介護医療保険料控除",
+        "func": calc_new_contract_deduction,
+        "formula": _NEW_CONTRACT_FORMULA,
+        "citation": _NEW_CONTRACT_CITATION,
+    },
+    "life_annuity_new": {
+        "label": "新契約の個人年金保険料",
+        "deduction": "個人年金保険料控除",
+        "func": calc_new_contract_deduction,
+        "formula": _NEW_CONTRACT_FORMULA,
+        "citation": _NEW_CONTRACT_CITATION,
+    },
+    "life_annuity_old": {
+        "label": "旧契約の個人年金保険料",
+        "deduction": "個人年金保険料控除",
+        "func": calc_old_contract_deduction,
+        "formula": _OLD_CONTRACT_FORMULA,
+        "citation": _OLD_CONTRACT_CITATION,
+    },
+    "earthquake": {
+        "label": "地震保険料",
+        "deduction": "地震保険料控除",
+        "func": calc_earthquake_insurance_deduction,
+        "formula": "5万円以下：全額／5万円超：一律5万円",
+        "citation": "地震保険料控除額の計算",
+    },
+    "old_long_term": {
+        "label": "旧長期損害保険料",
+        "deduction": "地震保険料控除（旧長期損害保険料分）",
+        "func": calc_old_long_term_deduction,
+        "formula": "〜1万円：全額／〜2万円：×1/2＋5千円／2万円超：一律1.5万円",
+        "citation": "地震保険料控除額の計算（旧長期損害保険料）",
+    },
+}
+
+# 「6万円」「60,000円」「1万5千円」「12万3456円」など（NFKC 正規化後の表記）
+_AMOUNT_RE = re.compile(
+    r"(?:(?P<man>\d+(?:\.\d+)?)万)?(?:(?P<sen>\d+)千)?(?P<yen>\d[\d,]*)?(?P<unit>円)?"
+)
+# 控除の「金額」を尋ねていること
+_AMOUNT_ASK_RE = re.compile(r"いくら|何円|控除額[はを]|計算して|計算すると|控除(?:額)?は[?？]?$")
+# 手続き・可否を尋ねる質問は RAG に任せる（「受けられますか」「どうすれば」など）
+_PROCEDURE_ASK_RE = re.compile(
+    r"どう(?:すれば|したら|やって)|できます|できる[?？か]|受けられ|でしょうか|必要|"
+    r"手続|書き方|記入|証明書|なくし|紛失|対象"
+)
+# 保険料の区分 → intent（新/旧契約で分かれるものは (新, 旧)。介護医療は新制度のみ）
+_CATEGORY_INTENTS = {
+    "一般生命保険料": ("life_general_new", "life_general_old"),
+    "生命保険料": ("life_general_new", "life_general_old"),
+    "介護医療保険料": ("life_medical", None),
+    "個人年金保険料": ("life_annuity_new", "life_annuity_old"),
+    "旧長期損害保険料": ("old_long_term", "old_long_term"),
+    "長期損害保険料": ("old_long_term", "old_long_term"),
+    "地震保険料": ("earthquake", "earthquake"),
+}
+_AMOUNT_PATTERN = r"(?:\d+(?:\.\d+)?万(?:\d+千)?(?:\d[\d,]*)?円?|\d+千(?:\d[\d,]*)?円?|\d[\d,]*円)"
+# 区分の名詞が金額に直接かかっていること（「生命保険料を6万円」「地震保険料に年間7万円」）
+_GOVERNED_AMOUNT_RE = re.compile(
+    r"(?P<category>" + "|".join(sorted(_CATEGORY_INTENTS, key=len, reverse=True)) + r")"
+    r"\s*(?:を|が|は|に|:)?\s*"
+    r"(?:年間|年額|年|(?P<monthly>毎月|月額|月々|1[かヶケカ]月あたり|月))?\s*(?:で|に)?\s*"
+    r"(?P<amount>" + _AMOUNT_PATTERN + r")"
+)
+# 月額を表す語（金額に直接かかっていない場合は、どの金額のことか分からないので RAG へ）
+_MONTHLY_RE = re.compile(r"毎月|月額|月々|1[かヶケカ]月|(?<!\d)月\s*(?:に|あたり)?\s*\d")
+# 控除の対象外の保険や、年・月以外の期間が出てくる質問は RAG に任せる
+_OTHER_INSURANCE_RE = re.compile(r"火災|(?<!長期)損害|学資|自動車|傷害|家財|賠償")
+_OTHER_PERIOD_RE = re.compile(r"半年|四半期|隔月|週|日額|(?:[2-9]|1[0-2])[かヶケカ]月")
+
+
+def _extract_amounts(text: str) -> List[int]:
+    amounts = []
+    for m in _AMOUNT_RE.finditer(text):
+        man, sen, yen, unit = m.group("man", "sen", "yen", "unit")
+        # 「万」「千」「円」のいずれかが付いた数字だけを金額とみなす
+        if not (man or sen or (yen and unit)):
+            continue
+        value = 0.0
+        if man:
+            value += float(man) * 10_000
+        if sen:
+            value += int(sen) * 1_000
+        if yen:
+            value += int(yen.replace(",", ""))
+        amounts.append(int(value))
+    return amounts
+
+
+def _detect_deduction_intent(text: str) -> Optional[Tuple[str, int, bool]]:
+    """金額がかかっている保険料の区分から (intent, 金額, 月額か) を返す。
+
+    質問中の金額が 1 つで、その金額に区分の名詞が直接かかっている場合だけ特定する。
+    それ以外（対象外の保険・半年などの期間・新旧の混在など）は None。
+    """
+    if _OTHER_INSURANCE_RE.search(text) or _OTHER_PERIOD_RE.search(text):
+        return None
+    if len(_extract_amounts(text)) != 1:
+        return None
+
+    matches = list(_GOVERNED_AMOUNT_RE.finditer(text))
+    if len(matches) != 1:
+        return None
+    m = matches[0]
+
+    monthly = m.group("monthly") is not None
+    if not monthly and _MONTHLY_RE.search(text):
+        return None
+
+    is_old = bool(re.search(r"旧契約|旧制度", text))
+    is_new = bool(re.search(r"新契約|新制度", text))
+    if is_old and is_new:
+        return None
+
+    new_intent, old_intent = _CATEGORY_INTENTS[m.group("category")]
+    intent = old_intent if is_old else new_intent
+    if intent is None:
+        return None
+    return intent, _extract_amounts(m.group("amount"))[0], monthly
+
+
+def answer_deduction_question(
+    question: str, corpus_name: str = ct.PURPOSE_NENCHO
+) -> Optional[Dict[str, Any]]:
+    """控除額を尋ねる数値の質問なら計算ツールで回答する。
+
+    例：「新契約の一般生命保険料が6万円なら控除はいくら？」
+    区分と金額を 1 つずつ特定できない質問は None を返し、RAG に任せる
+    （判定の例は DEDUCTION_ROUTING_EXAMPLES を参照）。
+    """
+    text = unicodedata.normalize("NFKC", question or "").strip()
+    if "控除" not in text or not _AMOUNT_ASK_RE.search(text):
+        return None
+    if _PROCEDURE_ASK_RE.search(text):
+        return None
+    # 計算ツールは所得税のみ対応
+    if "住民税" in text:
+        return None
+
+    detected = _detect_deduction_intent(text)
+    if detected is None:
+        return None
+    intent, premium, monthly = detected
+
+    tool = DEDUCTION_TOOLS[intent]
+    notes = []
+    if monthly:
+        notes.append(f"※月額 {premium:,}円 × 12か月 として年額に換算しています。")
+        premium *= 12
+    deduction = tool["func"](premium)
+
+    if intent in ("life_general_new", "life_annuity_new") and "新" not in text:
+        notes.append("※契約時期の指定がないため、新契約（平成24年1月1日以後の契約）として計算しています。")
+    notes.append("※このアプリの計算機能による簡易試算です（所得税）。他の契約との合算や上限は考慮していません。")
+
+    doc_label = ct.CORPORA[corpus_name]["doc_label"]
+    page_ref = f"参考：{doc_label}『{tool['citation']}』"
+    answer = (
+        f"{tool['label']}の年間の支払保険料が {premium:,}円 の場合、"
+        f"所得税の{tool['deduction']}の額は **{deduction:,}円** です。\n\n"
+        f"計算式：{tool['formula']}\n\n"
+        + "\n".join(notes)
+        + f"\n\n{page_ref}"
+    )
+
+    return {
+        "answer": answer,
+        "page_ref": page_ref,
+        "deduction": deduction,
+    }
+
+
+# 計算ツールに回す／回さない質問の例（python tools.py で確認できる）
+# 期待値は控除額（円）、None は RAG に任せるもの
+DEDUCTION_ROUTING_EXAMPLES = [
+    ("新契約の一般生命保険料が6万円なら控除はいくら？", 35_000),
+    ("介護医療保険料が35,000円の場合の控除額は？", 27_500),
+    ("旧契約の個人年金保険料 1万5千円の控除額を教えて", 15_000),
+    ("地震保険料に年間7万円払った場合の控除は？", 50_000),
+    ("旧長期損害保険料18000円の地震保険料控除はいくら", 14_000),
+    ("生命保険料を毎月5,000円支払っています。控除はいくら？", 35_000),
+    ("生命保険料を月1万円払っていますが控除はいくら？", 40_000),
+    ("地震保険料を4万円支払いました。旧長期損害保険料はありません。控除額はいくら？", 40_000),
+    ("火災保険料を3万円支払いました。地震保険料控除はいくら？", None),
+    ("保険料は損害保険で年6万円払っています。生命保険料控除はいくら？", None),
+    ("生命保険料を半年で3万円支払っています。控除はいくら？", None),
+    ("学資保険の保険料を6万円支払いました。生命保険料控除はいくら？", None),
+    ("生命保険料控除は12万円が上限？", None),
+    ("生命保険料を6万円支払っていますが、控除証明書をなくした場合はどうすればいいですか？", None),
+    ("介護医療保険料を5万円支払いましたが、控除は年末調整で受けられますか？", None),
+]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for question, expected in DEDUCTION_ROUTING_EXAMPLES:
+        result = answer_deduction_question(question)
+        actual = None if result is None else result["deduction"]
+        mark = "OK " if actual == expected else "NG "
+        failures += actual != expected
+        print(f"{mark}{question} → {actual}（期待値 {expected}）")
+    raise SystemExit(1 if failures else 0)
@@ -24,9 +24,9 @@ def extract_page_numbers_from_sources(sources: List[Any]) -> List[int]:
     # 重複を消してソート
     return sorted(set(pages))
 
-def build_page_reference_text(pages: List[int]) -> str:
+def build_page_reference_text(pages: List[int], doc_label: str = "年末調整の手引き") -> str:
     """ページ番号リストから「参考：年末調整の手引き P.xx, P.yy」形式の文字列を作る。"""
     if not pages:
-        return "参考：年末調整の手引き（該当ページ番号の特定ができませんでした）"
+        return f"参考：{doc_label}（該当ページ番号の特定ができませんでした）"
     joined = ", ".join(f"P.{p}" for p in pages)
-    return f"参考：年末調整の手引き {joined}"
+    return f"参考：{doc_label} {joined}"